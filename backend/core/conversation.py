@@ -3,10 +3,16 @@ Core conversation logic extracted from CLI chat.py for use in FastAPI backend.
 Handles streaming responses from Claude with memory tool integration.
 """
 
+import os
+import re
+import time
+import asyncio
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Iterator
 import json
 
 from anthropic import Anthropic
@@ -21,25 +27,59 @@ from session_trace import SessionTrace
 
 logger = logging.getLogger(__name__)
 
+# Prompt caching breakpoint applied to the static request prefix (tools + system)
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Advance the rolling conversation-history breakpoint every N assistant turns
+# (override with the CACHE_BREAKPOINT_EVERY_N environment variable)
+CACHE_BREAKPOINT_EVERY_N = 1
+
+# Cap on user/assistant turns kept verbatim; older turns are folded into a summary
+# (override with the MAX_CONVERSATION_TURNS environment variable, 0 = unbounded)
+MAX_CONVERSATION_TURNS = 50
+SUMMARY_MAX_CHARS = 4000
+SUMMARY_LINE_CHARS = 200
+
+# Parsed prompt bodies keyed by path: (st_mtime_ns, body without the date suffix)
+_PROMPT_CACHE: dict[str, tuple[int, str]] = {}
+
+# Drops whole comment lines and trailing whitespace in a single pass
+_COMMENT_RE = re.compile(r'(?m)^[ \t]*#.*\n?|[ \t]+$')
+
+# Coalesce streamed text deltas into one SSE frame per window (whichever limit is hit first)
+STREAM_FLUSH_BYTES = 64
+STREAM_FLUSH_INTERVAL = 0.016
+
+# Stream event types handled in the hot streaming loop
+EVT_DELTA = "content_block_delta"
+EVT_START = "content_block_start"
+
+# Conversations that can stream at once (the web UI keeps at most this many sessions).
+# Each stream blocks one of these threads while it waits on the API or a memory tool
+# call, so they get their own pool rather than starving the default executor.
+MAX_CONCURRENT_STREAMS = 20
+_STREAM_EXECUTOR = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_STREAMS, thread_name_prefix="conversation-stream"
+)
+
 
 def load_system_prompt(prompt_file: str) -> str:
     """Load system prompt from file, stripping comment lines and appending current date."""
     try:
-        with open(prompt_file, 'r', encoding='utf-8') as f:
-            lines = []
-            for line in f:
-                stripped = line.strip()
-                if stripped and not stripped.startswith('#'):
-                    lines.append(line.rstrip())
-                elif not stripped:
-                    lines.append('')
-            prompt = '\n'.join(lines).strip()
-
-            # Append current date/time
-            current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            prompt += f"\n\nToday's date is: {current_date}"
-
-            return prompt
+        mtime_ns = os.stat(prompt_file).st_mtime_ns
+        entry = _PROMPT_CACHE.get(prompt_file)
+        if entry and entry[0] == mtime_ns:
+            prompt = entry[1]
+        else:
+            data = Path(prompt_file).read_text(encoding='utf-8')
+            prompt = _COMMENT_RE.sub('', data).strip()
+            _PROMPT_CACHE[prompt_file] = (mtime_ns, prompt)
+
+        # Append current date/time (outside the cache, so it's always fresh)
+        current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        prompt += f"\n\nToday's date is: {current_date}"
+
+        return prompt
     except FileNotFoundError:
         logger.error(f"System prompt file not found: {prompt_file}")
         raise
@@ -62,6 +102,13 @@ def get_available_prompts(prompts_dir: str = "prompts") -> list[dict]:
     ]
 
 
+def _iter_runner_events(runner) -> Iterator[Any]:
+    """Flatten a streaming tool runner (one stream per API call) into a single event sequence."""
+    for stream in runner:
+        for event in stream:
+            yield event
+
+
 class ConversationManager:
     """Manages a conversation session with Claude and memory tool."""
 
@@ -69,8 +116,26 @@ class ConversationManager:
         self.client = Anthropic(api_key=api_key)
         self.model = model
         self.system_prompt = system_prompt
-        self.memory_tool = LocalFilesystemMemoryTool()
-        self.messages = []
+        # Structured system block so the prompt prefix is cached across turns
+        self.system_blocks = [
+            {"type": "text", "text": system_prompt, "cache_control": CACHE_CONTROL}
+        ]
+        # Breakpoint on the (only) tool caches the whole tools array
+        self.memory_tool = LocalFilesystemMemoryTool(cache_control=CACHE_CONTROL)
+        max_turns = int(os.getenv("MAX_CONVERSATION_TURNS", MAX_CONVERSATION_TURNS))
+        # Room for the summary exchange, the last exchange and the incoming one
+        max_turns = max(3, max_turns) if max_turns > 0 else 0
+        # Oldest turns are evicted in batches so the cached prefix is invalidated once per batch
+        self.summarize_batch_turns = max(2, max_turns // 4)
+        self.messages: deque[dict] = deque(maxlen=max_turns * 2 or None)
+        self._summary = ""
+        self.cache_breakpoint_every_n = max(
+            1, int(os.getenv("CACHE_BREAKPOINT_EVERY_N", CACHE_BREAKPOINT_EVERY_N))
+        )
+        # Incremental pointers into self.messages (avoid rescanning history each turn)
+        self._reset_message_pointers()
+        # Serializes turns (and resets) on this conversation across concurrent requests
+        self.lock = asyncio.Lock()
 
         # Initialize session trace
         self.trace = SessionTrace(model=model, system_prompt=system_prompt)
@@ -84,15 +149,107 @@ class ConversationManager:
 
         logger.info(f"Initialized conversation with model: {model}")
 
+    def _messages_with_cache_breakpoint(self) -> list[dict]:
+        """
+        Build the request messages with a rolling cache breakpoint.
+
+        Marks the newest assistant turn that falls on a CACHE_BREAKPOINT_EVERY_N
+        boundary so the conversation prefix up to it is served from the prompt
+        cache. Together with the tools and system breakpoints this stays within
+        Anthropic's limit of 4 cache_control blocks per request.
+        """
+        index = self._cache_breakpoint_idx
+        if index < 0:
+            return list(self.messages)
+
+        message = self.messages[index]
+        if not isinstance(message["content"], str) or not message["content"]:
+            return list(self.messages)
+
+        messages = list(self.messages)
+        messages[index] = {
+            "role": message["role"],
+            "content": [
+                {"type": "text", "text": message["content"], "cache_control": CACHE_CONTROL}
+            ]
+        }
+        return messages
+
+    def _append_assistant_message(self, content: str) -> None:
+        """Append an assistant turn and advance the cache breakpoint pointer in O(1)."""
+        self.messages.append({"role": "assistant", "content": content})
+        self._assistant_turns += 1
+        if self._assistant_turns % self.cache_breakpoint_every_n == 0:
+            self._cache_breakpoint_idx = len(self.messages) - 1
+
+    def _summarize_and_evict(self) -> None:
+        """
+        Fold the oldest turns into a synthetic summary exchange at the head of the history.
+
+        The summary is a condensed transcript of the evicted turns (durable facts are
+        expected to live in memory files). Message pointers are shifted to match.
+        """
+        removed = 0
+        if self._summary:
+            # Drop the previous summary exchange; its text is carried forward
+            self.messages.popleft()
+            self.messages.popleft()
+            removed += 2
+
+        lines = []
+        evicted = 0
+        # Always keep the most recent exchange verbatim
+        target = min(self.summarize_batch_turns * 2, len(self.messages) - 2)
+        # Keep evicting until the remaining history starts on a user turn
+        while self.messages and (evicted < target or self.messages[0]["role"] != "user"):
+            message = self.messages.popleft()
+            evicted += 1
+            content = message["content"] if isinstance(message["content"], str) else ""
+            condensed = " ".join(content.split())[:SUMMARY_LINE_CHARS]
+            lines.append(f"{message['role'].capitalize()}: {condensed}")
+        removed += evicted
+
+        summary = "\n".join(filter(None, [self._summary, *lines]))
+        if len(summary) > SUMMARY_MAX_CHARS:
+            # Keep the most recent lines
+            summary = summary[-SUMMARY_MAX_CHARS:].partition("\n")[2]
+        self._summary = summary
+
+        self.messages.appendleft({
+            "role": "assistant",
+            "content": "Understood, I'll keep this earlier context in mind."
+        })
+        self.messages.appendleft({
+            "role": "user",
+            "content": f"[Summary of earlier conversation]\n{summary}"
+        })
+
+        if self._cache_breakpoint_idx >= 0:
+            self._cache_breakpoint_idx -= removed - 2
+            if self._cache_breakpoint_idx < 2:
+                # The breakpoint turn was evicted; cache up to the summary exchange instead
+                self._cache_breakpoint_idx = 1
+        logger.info(f"Summarized {evicted} earlier messages ({len(self.messages)} kept)")
+
+    def _reset_message_pointers(self) -> None:
+        """Reset assistant-turn pointers after the message history is cleared."""
+        self._assistant_turns = 0
+        self._cache_breakpoint_idx = -1
+
     async def send_message_streaming(self, user_message: str) -> AsyncGenerator[dict, None]:
         """
         Send a message to Claude and return the response.
 
         Yields JSON events:
         - {"type": "thinking", "data": "Processing..."}
-        - {"type": "text", "data": "complete response text"}
+        - {"type": "text", "data": "coalesced response text chunk"}
+        - {"type": "tool_use_start", "data": {"tool": "memory"}}
         - {"type": "done", "data": {"tokens": {...}}}
         """
+        # Make room for this turn's user and assistant messages
+        if self.messages.maxlen and len(self.messages) + 2 > self.messages.maxlen:
+            self._summarize_and_evict()
+
         # Add user message
         self.messages.append({"role": "user", "content": user_message})
         self.trace.log_user_input(user_message)
@@ -108,42 +265,94 @@ class ConversationManager:
                 "data": "Processing..."
             }
 
-            # Use tool_runner to get complete response (including all tool calls)
+            # Streaming tool_runner runs all tool calls automatically, one stream per API call
             runner = self.client.beta.messages.tool_runner(
                 model=self.model,
                 max_tokens=2048,
-                system=self.system_prompt,
+                system=self.system_blocks,
                 tools=[self.memory_tool],
-                messages=self.messages,
-                betas=["context-management-2025-06-27"]
+                messages=self._messages_with_cache_breakpoint(),
+                betas=["context-management-2025-06-27"],
+                stream=True
             )
 
-            # Get final response (this runs all tool calls automatically)
+            # The sync runner (and memory tool) run on the dedicated stream pool, off the event loop
+            events = _iter_runner_events(runner)
+            buf: list[str] = []
+            buf_len = 0
+            streamed: list[str] = []  # flushed chunks, i.e. the full text the client received
+            separate = False  # text after a tool call comes from a new API message
+            last_flush = time.monotonic()
+
+            loop = asyncio.get_running_loop()
+            while (event := await loop.run_in_executor(_STREAM_EXECUTOR, next, events, None)) is not None:
+                event_type = event.type
+                if event_type == EVT_DELTA:
+                    try:
+                        chunk = event.delta.text
+                    except AttributeError:
+                        # Non-text deltas (e.g. tool input JSON)
+                        continue
+                    if separate:
+                        chunk = "\n\n" + chunk
+                        separate = False
+                    buf.append(chunk)
+                    buf_len += len(chunk)
+                    if buf_len >= STREAM_FLUSH_BYTES or time.monotonic() - last_flush >= STREAM_FLUSH_INTERVAL:
+                        streamed.append("".join(buf))
+                        yield {"type": "text", "data": streamed[-1]}
+                        buf.clear()
+                        buf_len = 0
+                        last_flush = time.monotonic()
+
+                elif event_type == EVT_START and event.content_block.type == "tool_use":
+                    if buf:
+                        streamed.append("".join(buf))
+                        yield {"type": "text", "data": streamed[-1]}
+                        buf.clear()
+                        buf_len = 0
+                        last_flush = time.monotonic()
+                    separate = bool(streamed)
+                    yield {"type": "tool_use_start", "data": {"tool": event.content_block.name}}
+
+            if buf:
+                streamed.append("".join(buf))
+                yield {"type": "text", "data": streamed[-1]}
+
+            # Runner is exhausted, so this returns the final message (for usage) without another request
             response = runner.until_done()
 
-            # Extract response text
-            response_text = ""
-            for block in response.content:
-                if hasattr(block, 'text'):
-                    response_text = block.text
-                    break
-
-            # Yield complete response
-            yield {
-                "type": "text",
-                "data": response_text
-            }
+            # Use the streamed text; only fall back to the final message if nothing was streamed
+            response_text = "".join(streamed)
+            if not response_text:
+                for block in response.content:
+                    if block.type == "text":
+                        response_text = block.text
+                        break
 
             # Add to messages
-            self.messages.append({"role": "assistant", "content": response_text})
+            self._append_assistant_message(response_text)
             self.trace.log_llm_response(response_text)
 
             # Track token usage
             usage = response.usage
             last_input = usage.input_tokens
             last_output = usage.output_tokens
-            last_cache_read = getattr(usage, 'cache_read_input_tokens', 0)
-            last_cache_write = getattr(usage, 'cache_creation_input_tokens', 0)
+            last_cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+            last_cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+
+            # Log cache hit ratio so prompt caching regressions are visible
+            prompt_tokens = last_input + last_cache_read + last_cache_write
+            hit_ratio = last_cache_read / prompt_tokens if prompt_tokens else 0.0
+            logger.info(
+                f"Cache hit ratio: {hit_ratio:.1%} "
+                f"(read: {last_cache_read}, write: {last_cache_write}, uncached: {last_input})"
+            )
+
+            self.trace.record_cache_stats(
+                cache_read_tokens=last_cache_read,
+                cache_write_tokens=last_cache_write
+            )
 
             self.total_input_tokens += last_input
             self.total_output_tokens += last_output
@@ -195,7 +404,9 @@ class ConversationManager:
     def clear_memories(self) -> str:
         """Clear all memories and reset conversation."""
         result = self.memory_tool.clear_all_memory()
-        self.messages = []
+        self.messages.clear()
+        self._summary = ""
+        self._reset_message_pointers()
 
         # Reset token counters
         self.total_input_tokens = 0
@@ -4,25 +4,34 @@ Provides HTTP streaming chat, memory operations, and session management.
 """
 
 import os
-import json
+import re
+import mmap
+import asyncio
 import logging
+import tempfile
 from pathlib import Path
-from typing import Optional
+from collections import OrderedDict
+from typing import Any, Iterator, Optional
 from contextlib import asynccontextmanager
+from uuid import uuid4
 
-from fastapi import FastAPI, HTTPException, Request
+import orjson
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Request
 from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-from backend.core.conversation import ConversationManager, load_system_prompt, get_available_prompts
+from backend.core.conversation import (
+    MAX_CONCURRENT_STREAMS, ConversationManager, load_system_prompt, get_available_prompts
+)
 
 # Add src to path for imports
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 from memory_tool import LocalFilesystemMemoryTool
+from session_trace import MANIFEST_FILENAME, summarize_trace
 from anthropic.types.beta import BetaMemoryTool20250818ViewCommand
 
 # Import generate_sequence_diagram from scripts
@@ -42,8 +51,36 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-# Global conversation manager (single-user POC)
-conversation_manager: Optional[ConversationManager] = None
+# Session IDs are embedded in trace filenames, so only allow path-safe characters
+SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_\-]+$')
+
+# Server-Sent Events frame delimiters
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+
+# Trace files larger than this are memory-mapped for parsing (smaller ones are read directly)
+MMAP_MIN_BYTES = 64 * 1024
+
+# Process umask, read once at import (os.umask can only be queried by setting it)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+# Active conversations keyed by client session ID (sent back as the X-Session-Id header)
+# in least-recently-used order
+SESSIONS: OrderedDict[str, ConversationManager] = OrderedDict()
+
+# Least recently used conversations are finalized and dropped beyond this many (e.g. closed tabs)
+# (one stream thread per session, see MAX_CONCURRENT_STREAMS)
+MAX_SESSIONS = MAX_CONCURRENT_STREAMS
+
+
+def _get_manager(session_id: Optional[str]) -> Optional[ConversationManager]:
+    """Look up the conversation for a client session ID, marking it as recently used."""
+    manager = SESSIONS.get(session_id) if session_id else None
+    if manager:
+        SESSIONS.move_to_end(session_id)
+    return manager
 
 
 @asynccontextmanager
@@ -52,9 +89,10 @@ async def lifespan(app: FastAPI):
     logger.info("Starting Memory System v2 Web UI")
     yield
     # Cleanup
-    if conversation_manager:
-        trace_file = conversation_manager.finalize()
+    for manager in SESSIONS.values():
+        trace_file = manager.finalize()
         logger.info(f"Session trace saved to: {trace_file}")
+    SESSIONS.clear()
 
 
 # Create FastAPI app
@@ -97,7 +135,7 @@ class SessionInitialize(BaseModel):
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "ok", "session_active": conversation_manager is not None}
+    return {"status": "ok", "session_active": bool(SESSIONS), "active_sessions": len(SESSIONS)}
 
 
 @app.get("/api/prompts")
@@ -115,90 +153,102 @@ async def get_prompt(prompt_name: str):
         raise HTTPException(status_code=404, detail="Prompt not found")
 
     try:
-        content = load_system_prompt(prompt_file)
+        content = await asyncio.to_thread(load_system_prompt, prompt_file)
         return {"name": prompt_name, "content": content}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/session/initialize")
-async def initialize_session(config: SessionInitialize):
-    """Initialize a new conversation session."""
-    global conversation_manager
-
-    # Finalize existing session if any
-    if conversation_manager:
-        conversation_manager.finalize()
-
+async def initialize_session(config: SessionInitialize, x_session_id: Optional[str] = Header(None)):
+    """Initialize a new conversation session, replacing the caller's existing one."""
     # Validate API key
     if not config.api_key:
         raise HTTPException(status_code=400, detail="API key required")
 
     # Load system prompt
     try:
-        system_prompt = load_system_prompt(config.system_prompt_file)
+        system_prompt = await asyncio.to_thread(load_system_prompt, config.system_prompt_file)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to load prompt: {e}")
 
+    # Finalize this client's existing session if any (after any in-flight stream completes)
+    previous = SESSIONS.pop(x_session_id, None) if x_session_id else None
+    if previous:
+        async with previous.lock:
+            previous.finalize()
+
     # Create new conversation manager
-    conversation_manager = ConversationManager(
+    session_id = uuid4().hex
+    SESSIONS[session_id] = ConversationManager(
         api_key=config.api_key,
         model=config.model,
         system_prompt=system_prompt
     )
 
+    while len(SESSIONS) > MAX_SESSIONS:
+        stale_id, stale = SESSIONS.popitem(last=False)
+        async with stale.lock:
+            stale.finalize()
+        logger.info(f"Dropped stale session {stale_id}")
+
     return {
         "status": "initialized",
+        "session_id": session_id,
         "model": config.model,
         "prompt_file": config.system_prompt_file
     }
 
 
 @app.get("/api/session/status")
-async def get_session_status():
+async def get_session_status(x_session_id: Optional[str] = Header(None)):
     """Get current session status."""
-    if not conversation_manager:
+    manager = _get_manager(x_session_id)
+    if not manager:
         return {"active": False}
 
     return {
         "active": True,
-        "model": conversation_manager.model,
-        "tokens": conversation_manager.get_token_stats(),
-        "message_count": len(conversation_manager.messages)
+        "model": manager.model,
+        "tokens": manager.get_token_stats(),
+        "message_count": len(manager.messages)
     }
 
 
 @app.get("/api/session/current")
-async def get_current_session():
-    """Get current active session ID."""
-    if not conversation_manager or not conversation_manager.trace:
+async def get_current_session(x_session_id: Optional[str] = Header(None)):
+    """Get the trace session ID of the caller's active session."""
+    manager = _get_manager(x_session_id)
+    if not manager or not manager.trace:
         return {"session_id": None}
 
     return {
-        "session_id": conversation_manager.trace.session_id
+        "session_id": manager.trace.session_id
     }
 
 
 @app.post("/api/chat")
-async def chat_streaming(message: ChatMessage):
+async def chat_streaming(message: ChatMessage, x_session_id: Optional[str] = Header(None)):
     """
     Send a message and stream Claude's response back.
     Returns Server-Sent Events (SSE) stream.
     """
-    if not conversation_manager:
+    manager = _get_manager(x_session_id)
+    if not manager:
         raise HTTPException(status_code=400, detail="Session not initialized. Call /api/session/initialize first.")
 
     async def event_generator():
         """Generate SSE events from conversation stream."""
         try:
-            async for event in conversation_manager.send_message_streaming(message.message):
-                # Format as SSE
-                event_data = json.dumps(event)
-                yield f"data: {event_data}\n\n"
+            # One turn at a time per session; other sessions stream independently
+            async with manager.lock:
+                async for event in manager.send_message_streaming(message.message):
+                    # Format as SSE (bytes pass through StreamingResponse without re-encoding)
+                    yield b"".join((_SSE_PREFIX, orjson.dumps(event), _SSE_SUFFIX))
         except Exception as e:
             logger.error(f"Error in chat stream: {e}", exc_info=True)
-            error_event = json.dumps({"type": "error", "data": {"message": str(e)}})
-            yield f"data: {error_event}\n\n"
+            error_event = orjson.dumps({"type": "error", "data": {"message": str(e)}})
+            yield b"".join((_SSE_PREFIX, error_event, _SSE_SUFFIX))
 
     return StreamingResponse(
         event_generator(),
@@ -210,34 +260,59 @@ async def chat_streaming(message: ChatMessage):
     )
 
 
-@app.get("/api/memory/files")
-async def list_memory_files():
-    """List all memory files."""
+def _walk_txt(root: Path) -> Iterator[os.DirEntry]:
+    """Recursively yield .txt file entries under root (DirEntry caches its stat result)."""
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_txt(entry.path)
+            elif entry.name.endswith('.txt') and entry.is_file():
+                yield entry
+
+
+# Blocking file IO/CPU work runs via asyncio.to_thread so it doesn't stall SSE streams
+def _list_memory_files_sync() -> dict:
+    """Walk the memory directory and describe each file."""
     memory_dir = Path("memory/memories")
     if not memory_dir.exists():
         return {"files": []}
 
     files = []
-    for file_path in memory_dir.rglob("*.txt"):
-        relative_path = file_path.relative_to(memory_dir)
+    for entry in _walk_txt(memory_dir):
+        st = entry.stat()
         files.append({
-            "path": str(relative_path),
-            "name": file_path.name,
-            "size": file_path.stat().st_size,
-            "modified": file_path.stat().st_mtime
+            "path": os.path.relpath(entry.path, memory_dir),
+            "name": entry.name,
+            "size": st.st_size,
+            "modified": st.st_mtime
         })
 
     return {"files": files}
 
 
-@app.get("/api/memory/files/{file_path:path}")
-async def get_memory_file(file_path: str):
-    """Get content of a specific memory file."""
-    full_path = Path("memory/memories") / file_path
+@app.get("/api/memory/files")
+async def list_memory_files():
+    """List all memory files."""
+    return await asyncio.to_thread(_list_memory_files_sync)
+
+
+def _resolve_memory_file(file_path: str) -> Path:
+    """Resolve a memory file path, rejecting paths that escape the memory directory."""
+    memory_dir = Path("memory/memories").resolve()
+    full_path = (memory_dir / file_path).resolve()
 
-    if not full_path.exists():
+    if not full_path.is_relative_to(memory_dir):
+        raise HTTPException(status_code=400, detail="Invalid file path")
+    if not full_path.is_file():
         raise HTTPException(status_code=404, detail="File not found")
 
+    return full_path
+
+
+def _get_memory_file_sync(file_path: str) -> dict:
+    """Read a memory file's content and size."""
+    full_path = _resolve_memory_file(file_path)
+
     try:
         content = full_path.read_text(encoding='utf-8')
         return {
@@ -249,112 +324,203 @@ async def get_memory_file(file_path: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/memory/files/{file_path:path}")
+async def get_memory_file(file_path: str, raw: bool = False):
+    """
+    Get content of a specific memory file.
+
+    With ?raw=true the file is streamed as text/plain (supports Range requests)
+    instead of being read into a JSON body.
+    """
+    if raw:
+        return FileResponse(_resolve_memory_file(file_path), media_type="text/plain")
+
+    return await asyncio.to_thread(_get_memory_file_sync, file_path)
+
+
 @app.delete("/api/memory/clear")
-async def clear_all_memories():
+async def clear_all_memories(x_session_id: Optional[str] = Header(None)):
     """Clear all memory files."""
-    if not conversation_manager:
+    manager = _get_manager(x_session_id)
+    if not manager:
         raise HTTPException(status_code=400, detail="Session not initialized")
 
-    result = conversation_manager.clear_memories()
+    async with manager.lock:
+        result = manager.clear_memories()
     return {"message": result}
 
 
-@app.get("/api/sessions")
-async def list_sessions():
-    """List all recorded session files."""
+def _load_json_file(path: Path) -> Any:
+    """Parse a JSON file with orjson, memory-mapping large files to avoid copying them."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= MMAP_MIN_BYTES:
+            return orjson.loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            return orjson.loads(view)
+
+
+def _read_session_manifest(sessions_dir: Path) -> dict[str, dict]:
+    """Read the sessions manifest into summaries keyed by trace filename (later lines win)."""
+    manifest_file = sessions_dir / MANIFEST_FILENAME
+    summaries = {}
+    if not manifest_file.exists():
+        return summaries
+
+    with open(manifest_file, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                summary = orjson.loads(line)
+            except orjson.JSONDecodeError as e:
+                logger.warning(f"Skipping invalid manifest line: {e}")
+                continue
+            filename = summary.get("filename") if isinstance(summary, dict) else None
+            if not filename:
+                logger.warning("Skipping manifest line without a filename")
+                continue
+            summaries[filename] = summary
+
+    return summaries
+
+
+def _append_session_manifest(sessions_dir: Path, summaries: list[dict]) -> None:
+    """Append session summaries that are missing from the manifest."""
+    if not summaries:
+        return
+    try:
+        with open(sessions_dir / MANIFEST_FILENAME, 'ab') as f:
+            f.write(b"".join(orjson.dumps(summary) + b"\n" for summary in summaries))
+    except OSError as e:
+        logger.error(f"Failed to update session manifest: {e}")
+        return
+    logger.info(f"Backfilled session manifest with {len(summaries)} sessions")
+
+
+def _find_session_file(sessions_dir: Path, session_id: str) -> Optional[Path]:
+    """Locate a session trace file by ID via its filename, falling back to the manifest."""
+    if not SESSION_ID_RE.match(session_id):
+        raise HTTPException(status_code=400, detail="Invalid session ID")
+
+    candidate = sessions_dir / f"session_{session_id}.json"
+    if candidate.exists():
+        return candidate
+
+    # Legacy files whose name doesn't encode the session ID
+    for summary in _read_session_manifest(sessions_dir).values():
+        if summary.get("id") == session_id:
+            session_file = sessions_dir / summary["filename"]
+            if session_file.exists():
+                return session_file
+
+    return None
+
+
+def _list_sessions_sync(live_files: set[str]) -> dict:
+    """
+    Build session summaries from the manifest, reading only the traces of live sessions.
+
+    live_files holds the trace filenames of active conversations; those are still
+    being written, so they're parsed on each call instead of being indexed.
+    """
     sessions_dir = Path("sessions")
     if not sessions_dir.exists():
         return {"sessions": []}
 
+    summaries = _read_session_manifest(sessions_dir)
+
     sessions = []
+    backfill = []
     for session_file in sorted(sessions_dir.glob("session_*.json"), reverse=True):
-        try:
-            with open(session_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            # Get total tokens from last token_usage event
-            total_tokens = 0
-            token_events = [
-                e for e in data.get("events", [])
-                if e.get("event_type") == "token_usage"
-            ]
-            if token_events:
-                last_event = token_events[-1]
-                cumulative = last_event.get("cumulative", {})
-                total_tokens = (
-                    cumulative.get("total_input_tokens", 0) +
-                    cumulative.get("total_output_tokens", 0)
-                )
-
-            sessions.append({
-                "id": data.get("session_id", session_file.stem),
-                "filename": session_file.name,
-                "start_time": data.get("start_time"),
-                "end_time": data.get("end_time"),
-                "model": data.get("model"),
-                "event_count": len(data.get("events", [])),
-                "total_tokens": total_tokens
-            })
-        except Exception as e:
-            logger.error(f"Error reading session {session_file}: {e}")
-            continue
-
+        summary = summaries.get(session_file.name)
+        if summary is None:
+            # Live sessions, traces recorded before the manifest existed, and sessions
+            # that never finalized (crash or kill)
+            try:
+                data = _load_json_file(session_file)
+            except Exception as e:
+                logger.error(f"Error reading session {session_file}: {e}")
+                continue
+            summary = summarize_trace(data, session_file.name)
+            if session_file.name not in live_files:
+                backfill.append(summary)
+        sessions.append(summary)
+
+    # Index everything but live traces so later listings don't parse them again
+    # (a session that does finalize later appends a newer line, which wins)
+    _append_session_manifest(sessions_dir, backfill)
     return {"sessions": sessions}
 
 
-@app.get("/api/sessions/{session_id}")
-async def get_session(session_id: str):
-    """Get details of a specific session."""
-    sessions_dir = Path("sessions")
-    session_file = None
+@app.get("/api/sessions")
+async def list_sessions():
+    """List all recorded session files."""
+    live_files = {manager.trace.trace_file.name for manager in SESSIONS.values()}
+    return await asyncio.to_thread(_list_sessions_sync, live_files)
 
-    # Find session file by ID
-    for f in sessions_dir.glob("session_*.json"):
-        with open(f, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            if data.get("session_id") == session_id:
-                session_file = f
-                break
 
+def _get_session_sync(session_id: str) -> dict:
+    """Load a session trace by ID."""
+    sessions_dir = Path("sessions")
+    session_file = _find_session_file(sessions_dir, session_id)
     if not session_file:
         raise HTTPException(status_code=404, detail="Session not found")
 
     try:
-        with open(session_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return data
+        return _load_json_file(session_file)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/sessions/{session_id}/diagram")
-async def generate_session_diagram(session_id: str):
-    """Generate Mermaid sequence diagram for a session."""
-    sessions_dir = Path("sessions")
-    session_file = None
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Get details of a specific session."""
+    return await asyncio.to_thread(_get_session_sync, session_id)
+
+
+def _write_text_atomic(path: Path, text: str, mtime_ns: Optional[int] = None) -> None:
+    """
+    Write text via a temp file and rename, so readers never see a partial file.
+
+    The file gets the usual umask-derived mode (mkstemp creates it 0600) and,
+    if given, the modification time mtime_ns.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        if mtime_ns is not None:
+            os.utime(tmp_path, ns=(mtime_ns, mtime_ns))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"Error writing {path}: {e}")
+        Path(tmp_path).unlink(missing_ok=True)
 
-    # Find session file by ID
-    for f in sessions_dir.glob("session_*.json"):
-        with open(f, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            if data.get("session_id") == session_id:
-                session_file = f
-                break
 
+def _generate_session_diagram_sync(session_id: str, background_tasks: BackgroundTasks) -> dict:
+    """Generate (or reuse) the Mermaid diagram for a session and save it."""
+    sessions_dir = Path("sessions")
+    session_file = _find_session_file(sessions_dir, session_id)
     if not session_file:
         raise HTTPException(status_code=404, detail="Session not found")
 
     try:
-        with open(session_file, 'r', encoding='utf-8') as f:
-            trace_data = json.load(f)
+        diagram_file = sessions_dir / f"diagram_{session_id}.md"
 
-        # Generate diagram
-        diagram = generate_mermaid_diagram(trace_data)
+        # Saved diagrams carry the mtime of the trace they were generated from,
+        # recorded before reading it so writes racing the read force a regeneration
+        trace_mtime_ns = session_file.stat().st_mtime_ns
+        if diagram_file.exists() and diagram_file.stat().st_mtime_ns == trace_mtime_ns:
+            diagram = diagram_file.read_text(encoding='utf-8')
+        else:
+            trace_data = _load_json_file(session_file)
 
-        # Save diagram file
-        diagram_file = sessions_dir / f"diagram_{session_id}.md"
-        with open(diagram_file, 'w', encoding='utf-8') as f:
-            f.write(diagram)
+            # Generate diagram
+            diagram = generate_mermaid_diagram(trace_data)
+
+            # Save diagram file after the response is sent
+            background_tasks.add_task(_write_text_atomic, diagram_file, diagram, trace_mtime_ns)
 
         return {
             "session_id": session_id,
@@ -366,6 +532,12 @@ async def generate_session_diagram(session_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/sessions/{session_id}/diagram")
+async def generate_session_diagram(session_id: str, background_tasks: BackgroundTasks):
+    """Generate Mermaid sequence diagram for a session."""
+    return await asyncio.to_thread(_generate_session_diagram_sync, session_id, background_tasks)
+
+
 @app.get("/api/config")
 async def get_config():
     """Get current configuration."""
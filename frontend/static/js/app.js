@@ -5,6 +5,7 @@
 // Global state
 const AppState = {
     sessionActive: false,
+    sessionId: sessionStorage.getItem('session_id'),
     apiKey: localStorage.getItem('anthropic_api_key') || '',
     model: localStorage.getItem('anthropic_model') || 'claude-sonnet-4-5-20250929',
     systemPromptFile: localStorage.getItem('system_prompt_file') || '',
@@ -14,6 +15,16 @@ const AppState = {
 // API base URL
 const API_BASE = window.location.origin;
 
+/**
+ * Build request headers, identifying this tab's session once initialized
+ */
+function sessionHeaders(headers = {}) {
+    if (AppState.sessionId) {
+        headers['X-Session-Id'] = AppState.sessionId;
+    }
+    return headers;
+}
+
 /**
  * Initialize the application
  */
@@ -85,7 +96,7 @@ async function initializeSession() {
     try {
         const response = await fetch(`${API_BASE}/api/session/initialize`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: sessionHeaders({ 'Content-Type': 'application/json' }),
             body: JSON.stringify({
                 api_key: AppState.apiKey,
                 model: AppState.model,
@@ -100,6 +111,8 @@ async function initializeSession() {
 
         const data = await response.json();
         AppState.sessionActive = true;
+        AppState.sessionId = data.session_id;
+        sessionStorage.setItem('session_id', data.session_id);
 
         statusEl.innerHTML = '<i class="bi bi-circle-fill"></i> Connected';
         statusEl.className = 'badge bg-success connected';
@@ -177,7 +190,8 @@ function setupEventListeners() {
 
         try {
             const response = await fetch(`${API_BASE}/api/memory/clear`, {
-                method: 'DELETE'
+                method: 'DELETE',
+                headers: sessionHeaders()
             });
 
             if (!response.ok) {
@@ -56,7 +56,7 @@ async function sendMessage() {
         // Send message and stream response
         const response = await fetch(`${API_BASE}/api/chat`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: sessionHeaders({ 'Content-Type': 'application/json' }),
             body: JSON.stringify({ message })
         });
 
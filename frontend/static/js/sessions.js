@@ -16,7 +16,9 @@ async function refreshSessions() {
         currentSessions = sessionsData.sessions || [];
 
         // Fetch current session ID
-        const currentResponse = await fetch(`${API_BASE}/api/session/current`);
+        const currentResponse = await fetch(`${API_BASE}/api/session/current`, {
+            headers: sessionHeaders()
+        });
         const currentData = await currentResponse.json();
         currentSessionId = currentData.session_id;
 
@@ -11,11 +11,22 @@ Usage:
 The diagram is saved to ./diagrams/ directory with a name based on the session ID.
 """
 
+import re
 import json
 import argparse
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Callable, Dict, List, Any
+
+
+# Characters that can't appear raw in Mermaid message text, and their replacements
+_ESC_RE = re.compile(r'[\n"]')
+_ESC_MAP = {'\n': '<br/>', '"': "'"}
+
+
+def _escape_match(match: re.Match) -> str:
+    """Map a matched special character to its Mermaid-safe replacement."""
+    return _ESC_MAP[match.group(0)]
 
 
 def escape_text(text: str, max_length: int = 50) -> str:
@@ -29,9 +40,12 @@ def escape_text(text: str, max_length: int = 50) -> str:
     Returns:
         Escaped and truncated text
     """
+    # Common case: short text with nothing to escape
+    if len(text) <= max_length and not _ESC_RE.search(text):
+        return text
+
     # Replace newlines and quotes
-    text = text.replace('\n', '<br/>')
-    text = text.replace('"', "'")
+    text = _ESC_RE.sub(_escape_match, text)
 
     # Truncate if too long
     if len(text) > max_length:
@@ -40,6 +54,104 @@ def escape_text(text: str, max_length: int = 50) -> str:
     return text
 
 
+def _handle_user_input(event: Dict[str, Any], lines: List[str], state: Dict[str, Any]) -> None:
+    """Start a new conversation turn."""
+    state['turn_number'] += 1
+    content = escape_text(event.get('content', ''))
+
+    lines.extend((
+        "",
+        "    rect rgb(200, 220, 255)",
+        f"        Note over User,MemorySystem: Turn {state['turn_number']}: User Input",
+        "",
+        f'        User->>HostApp: "{content}"',
+        "        HostApp->>HostApp: Append to messages",
+    ))
+    state['in_turn'] = True
+
+
+def _handle_llm_request(event: Dict[str, Any], lines: List[str], state: Dict[str, Any]) -> None:
+    """Show the request sent to the LLM."""
+    if state['in_turn']:
+        lines.extend((
+            "",
+            f"        HostApp->>LLM: POST /messages<br/>tools: {event.get('tools', [])}",
+        ))
+
+
+def _handle_tool_call(event: Dict[str, Any], lines: List[str], state: Dict[str, Any]) -> None:
+    """Show the LLM calling the memory tool."""
+    if event.get('tool_name', '') != 'memory':
+        return
+
+    command = event.get('command', '')
+    parameters = event.get('parameters', {})
+
+    # Format parameters for display
+    params_str = ', '.join([f"{k}={repr(v)[:30]}" for k, v in parameters.items()])
+    if len(params_str) > 50:
+        params_str = params_str[:50] + "..."
+
+    lines.extend((
+        "",
+        f"        Note over LLM: Decides to {command}",
+        f"        LLM->>MemorySystem: {command}({params_str})",
+        "        activate MemorySystem",
+    ))
+
+
+def _handle_tool_result(event: Dict[str, Any], lines: List[str], state: Dict[str, Any]) -> None:
+    """Show the memory tool's result returned to the LLM."""
+    if event.get('tool_name', '') != 'memory':
+        return
+
+    if event.get('success', True):
+        result_preview = escape_text(event.get('result', ''), 40)
+        lines.append(f'        MemorySystem-->>LLM: {result_preview}')
+    else:
+        error_msg = escape_text(event.get('error') or 'Error', 40)
+        lines.append(f'        MemorySystem-->>LLM: ERROR: {error_msg}')
+    lines.append("        deactivate MemorySystem")
+
+
+def _handle_llm_response(event: Dict[str, Any], lines: List[str], state: Dict[str, Any]) -> None:
+    """Show the LLM's response and close the current turn."""
+    content = escape_text(event.get('content', ''), 60)
+
+    lines.extend((
+        "",
+        "        Note over LLM: Ready to respond",
+        f'        LLM-->>HostApp: "{content}"',
+        "        HostApp->>HostApp: Append to messages",
+        f'        HostApp-->>User: "{content}"',
+    ))
+
+    if state['in_turn']:
+        lines.append("    end")
+        state['in_turn'] = False
+
+
+def _handle_error(event: Dict[str, Any], lines: List[str], state: Dict[str, Any]) -> None:
+    """Show an error note."""
+    error_msg = escape_text(event.get('message', 'Unknown error'), 40)
+    lines.append(f"    Note over HostApp: ERROR: {error_msg}")
+
+
+def _handle_noop(event: Dict[str, Any], lines: List[str], state: Dict[str, Any]) -> None:
+    """Ignore event types that aren't drawn (e.g. token_usage)."""
+
+
+# Event type -> handler that appends the event's diagram lines
+_HANDLERS: Dict[str, Callable[[Dict[str, Any], List[str], Dict[str, Any]], None]] = {
+    'user_input': _handle_user_input,
+    'llm_request': _handle_llm_request,
+    'tool_call': _handle_tool_call,
+    'tool_result': _handle_tool_result,
+    'llm_response': _handle_llm_response,
+    'error': _handle_error,
+}
+
+
 def generate_mermaid_diagram(trace_data: Dict[str, Any]) -> str:
     """
     Generate a Mermaid sequence diagram from session trace data.
@@ -67,87 +179,20 @@ def generate_mermaid_diagram(trace_data: Dict[str, Any]) -> str:
         "    Note over HostApp: Session Started",
     ]
 
-    events = trace_data.get('events', [])
-    turn_number = 0
-    in_turn = False
-
-    for i, event in enumerate(events):
-        event_type = event.get('event_type')
-
-        if event_type == 'user_input':
-            # Start a new conversation turn
-            turn_number += 1
-            content = escape_text(event.get('content', ''))
-
-            lines.append("")
-            lines.append(f"    rect rgb(200, 220, 255)")
-            lines.append(f"        Note over User,MemorySystem: Turn {turn_number}: User Input")
-            lines.append("")
-            lines.append(f'        User->>HostApp: "{content}"')
-            lines.append("        HostApp->>HostApp: Append to messages")
-            in_turn = True
-
-        elif event_type == 'llm_request':
-            if in_turn:
-                lines.append("")
-                lines.append(f"        HostApp->>LLM: POST /messages<br/>tools: {event.get('tools', [])}")
-
-        elif event_type == 'tool_call':
-            tool_name = event.get('tool_name', '')
-            command = event.get('command', '')
-            parameters = event.get('parameters', {})
-
-            if tool_name == 'memory':
-                # Format parameters for display
-                params_str = ', '.join([f"{k}={repr(v)[:30]}" for k, v in parameters.items()])
-                if len(params_str) > 50:
-                    params_str = params_str[:50] + "..."
-
-                lines.append("")
-                lines.append(f"        Note over LLM: Decides to {command}")
-                lines.append(f"        LLM->>MemorySystem: {command}({params_str})")
-                lines.append("        activate MemorySystem")
-
-        elif event_type == 'tool_result':
-            tool_name = event.get('tool_name', '')
-            command = event.get('command', '')
-            success = event.get('success', True)
-            error = event.get('error')
-            result = event.get('result', '')
-
-            if tool_name == 'memory':
-                if success:
-                    result_preview = escape_text(result, 40)
-                    lines.append(f'        MemorySystem-->>LLM: {result_preview}')
-                else:
-                    error_msg = escape_text(error or 'Error', 40)
-                    lines.append(f'        MemorySystem-->>LLM: ERROR: {error_msg}')
-                lines.append("        deactivate MemorySystem")
-
-        elif event_type == 'llm_response':
-            content = escape_text(event.get('content', ''), 60)
-
-            lines.append("")
-            lines.append("        Note over LLM: Ready to respond")
-            lines.append(f'        LLM-->>HostApp: "{content}"')
-            lines.append("        HostApp->>HostApp: Append to messages")
-            lines.append(f'        HostApp-->>User: "{content}"')
-
-            if in_turn:
-                lines.append("    end")
-                in_turn = False
-
-        elif event_type == 'error':
-            error_msg = escape_text(event.get('message', 'Unknown error'), 40)
-            lines.append(f"    Note over HostApp: ERROR: {error_msg}")
+    state = {'turn_number': 0, 'in_turn': False}
+
+    for event in trace_data.get('events', []):
+        _HANDLERS.get(event.get('event_type'), _handle_noop)(event, lines, state)
 
     # Close any open turn
-    if in_turn:
+    if state['in_turn']:
         lines.append("    end")
 
-    lines.append("")
-    lines.append("    Note over HostApp: Session Ended")
-    lines.append("```")
+    lines.extend((
+        "",
+        "    Note over HostApp: Session Ended",
+        "```",
+    ))
 
     return '\n'.join(lines)
 
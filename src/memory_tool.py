@@ -37,14 +37,16 @@ class LocalFilesystemMemoryTool(BetaAbstractMemoryTool):
     Claude autonomously decides when to create, read, update, or delete memories.
     """
 
-    def __init__(self, base_path: str = "./memory"):
+    def __init__(self, base_path: str = "./memory", cache_control: Optional[dict] = None):
         """
         Initialize the memory tool with a storage directory.
 
         Args:
             base_path: Base directory for storing memory files
+            cache_control: Optional prompt caching breakpoint for the tool definition
+                (e.g. {"type": "ephemeral"})
         """
-        super().__init__()
+        super().__init__(cache_control=cache_control)
         self.base_path = Path(base_path)
         self.memory_root = self.base_path / "memories"
         self.memory_root.mkdir(exist_ok=True, parents=True)
@@ -9,18 +9,71 @@ This module provides a JSON-based trace system that captures:
 - Token usage statistics
 
 Each session is stored in a separate timestamped JSON file in the sessions/ directory.
+Events are buffered in memory and the file is atomically replaced at most once per flush interval
+(and on finalize), rather than after every event.
+Finalized sessions are also summarized in sessions/manifest.jsonl (one JSON object per
+line) so session listings don't need to parse every trace file.
 """
 
-import json
+import os
 import logging
+import tempfile
+import threading
 from pathlib import Path
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 from uuid import uuid4
 
+import orjson
+
 
 logger = logging.getLogger(__name__)
 
+# Append-only index of finalized sessions, stored alongside the trace files
+MANIFEST_FILENAME = "manifest.jsonl"
+
+# Seconds to batch trace events before rewriting the trace file
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+# Process umask, read once at import (os.umask can only be queried by setting it)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def summarize_trace(trace: Dict[str, Any], filename: str) -> Dict[str, Any]:
+    """
+    Build the session listing summary for a trace.
+
+    Args:
+        trace: Parsed session trace data
+        filename: Name of the trace file
+
+    Returns:
+        Summary with id, filename, timestamps, model, event count and total tokens
+    """
+    events = trace.get("events", [])
+
+    # Get total tokens from last token_usage event
+    total_tokens = 0
+    for event in reversed(events):
+        if event.get("event_type") == "token_usage":
+            cumulative = event.get("cumulative", {})
+            total_tokens = (
+                cumulative.get("total_input_tokens", 0) +
+                cumulative.get("total_output_tokens", 0)
+            )
+            break
+
+    return {
+        "id": trace.get("session_id", Path(filename).stem),
+        "filename": filename,
+        "start_time": trace.get("start_time"),
+        "end_time": trace.get("end_time"),
+        "model": trace.get("model"),
+        "event_count": len(events),
+        "total_tokens": total_tokens
+    }
+
 
 class SessionTrace:
     """
@@ -32,7 +85,13 @@ class SessionTrace:
     - Token usage tracking
     """
 
-    def __init__(self, base_path: str = "./sessions", model: str = "", system_prompt: str = ""):
+    def __init__(
+        self,
+        base_path: str = "./sessions",
+        model: str = "",
+        system_prompt: str = "",
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL
+    ):
         """
         Initialize a new session trace.
 
@@ -40,6 +99,7 @@ class SessionTrace:
             base_path: Directory for storing session trace files
             model: Claude model version being used
             system_prompt: System prompt for this session
+            flush_interval: Seconds to batch events before writing the trace file
         """
         self.base_path = Path(base_path)
         self.base_path.mkdir(exist_ok=True, parents=True)
@@ -55,25 +115,89 @@ class SessionTrace:
             "start_time": datetime.now().isoformat(),
             "model": model,
             "system_prompt": system_prompt,
+            "cache_stats": {
+                "requests": 0,
+                "hits": 0,
+                "hit_rate": 0.0,
+                "cache_read_tokens": 0,
+                "cache_write_tokens": 0
+            },
             "events": []
         }
 
         # Determine trace file path
         self.trace_file = self.base_path / f"session_{self.session_id}.json"
 
+        # Batched writes: events may be logged from the event loop and from tool threads
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Held by the flushing thread across snapshot and write, so writes land in order
+        # without blocking event logging while the file is being written
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._flush_timer: Optional[threading.Timer] = None
+
         logger.info(f"[TRACE] Session started: {self.session_id}")
         logger.debug(f"[TRACE] Trace file: {self.trace_file}")
 
         # Write initial trace file
-        self._save()
+        self._save(self._serialize())
+
+    def _serialize(self) -> bytes:
+        """Serialize the current trace (caller holds the lock once other threads may log)."""
+        return orjson.dumps(self.trace, option=orjson.OPT_INDENT_2)
 
-    def _save(self) -> None:
-        """Save the current trace to disk."""
+    def _save(self, data: bytes) -> None:
+        """
+        Save a serialized trace to disk.
+
+        Writes a temp file and renames it over the trace, so readers (which may
+        memory-map large traces) keep the previous file instead of seeing it truncated.
+        """
+        tmp_path = None
         try:
-            with open(self.trace_file, 'w', encoding='utf-8') as f:
-                json.dump(self.trace, f, indent=2, ensure_ascii=False)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=self.base_path, prefix=f".{self.trace_file.name}.", suffix=".tmp"
+            )
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+            os.replace(tmp_path, self.trace_file)
         except Exception as e:
             logger.error(f"[TRACE] Failed to save trace file: {e}")
+            if tmp_path:
+                Path(tmp_path).unlink(missing_ok=True)
+
+    def _schedule_flush(self) -> None:
+        """Mark the trace dirty and start a deferred flush if one isn't pending (caller holds the lock)."""
+        self._dirty = True
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self) -> None:
+        """Write any buffered events to disk (don't call while holding the trace lock)."""
+        with self._write_lock:
+            with self._lock:
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                if not self._dirty:
+                    return
+                data = self._serialize()
+                self._dirty = False
+            self._save(data)
+
+    def _append_to_manifest(self) -> None:
+        """Append this session's summary to the sessions manifest."""
+        with self._lock:
+            summary = summarize_trace(self.trace, self.trace_file.name)
+        try:
+            with open(self.base_path / MANIFEST_FILENAME, 'ab') as f:
+                f.write(orjson.dumps(summary) + b"\n")
+        except Exception as e:
+            logger.error(f"[TRACE] Failed to update session manifest: {e}")
 
     def _add_event(self, event_type: str, **kwargs) -> None:
         """
@@ -89,8 +213,9 @@ class SessionTrace:
         }
         event.update(kwargs)
 
-        self.trace["events"].append(event)
-        self._save()
+        with self._lock:
+            self.trace["events"].append(event)
+            self._schedule_flush()
 
         logger.debug(f"[TRACE] Event recorded: {event_type}")
 
@@ -217,6 +342,29 @@ class SessionTrace:
             }
         )
 
+    def record_cache_stats(self, cache_read_tokens: int, cache_write_tokens: int) -> None:
+        """
+        Update prompt caching counters for the session.
+
+        A request counts as a hit when any input tokens were read from the cache.
+        Counters are persisted with the next flush.
+
+        Args:
+            cache_read_tokens: Cache read tokens for last request
+            cache_write_tokens: Cache write tokens for last request
+        """
+        with self._lock:
+            stats = self.trace["cache_stats"]
+            stats["requests"] += 1
+            if cache_read_tokens > 0:
+                stats["hits"] += 1
+            stats["hit_rate"] = stats["hits"] / stats["requests"]
+            stats["cache_read_tokens"] += cache_read_tokens
+            stats["cache_write_tokens"] += cache_write_tokens
+            self._schedule_flush()
+
+        logger.debug(f"[TRACE] Cache stats: {stats['hits']}/{stats['requests']} requests hit")
+
     def log_error(self, error_type: str, message: str, traceback: Optional[str] = None) -> None:
         """
         Record an error event.
@@ -243,8 +391,11 @@ class SessionTrace:
         Returns:
             Path to the trace file
         """
-        self.trace["end_time"] = datetime.now().isoformat()
-        self._save()
+        with self._lock:
+            self.trace["end_time"] = datetime.now().isoformat()
+            self._dirty = True
+        self.flush()
+        self._append_to_manifest()
 
         logger.info(f"[TRACE] Session finalized: {self.session_id}")
         return str(self.trace_file)